@@ -183,6 +183,7 @@ class CodeAnalyzer:
             "best_practices_result": best_practices_result,
             "bug_detector_result": bug_detector_result,
             "vulnerability_detector_result": vulnerability_detector_result,
+            "use_cache": data.get("use_cache", True),
         }
         
         if use_cache and cached_recommendations:
@@ -248,6 +249,7 @@ class CodeAnalyzer:
             "requirements": original_data.get("requirements", ""),
             "code": original_data.get("code", ""),
             "test_cases": original_data.get("test_cases", ""),
+            "use_cache": original_data.get("use_cache", True),
         }
         
         # Можно добавить специфичные поля для разных типов агентов
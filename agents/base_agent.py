@@ -27,23 +27,29 @@ class CodeAnalysisAgent:
         self.gigachat_service = gigachat_service
         self.prompt = prompt
         self.result_schema = result_schema
+        # Наличие примера ответа в промпте не меняется между вызовами агента
+        self.has_example = "```json" in prompt
     
     def analyze(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Выполнение анализа данных.
         
         Args:
-            data: Данные для анализа.
+            data: Данные для анализа. Ключ use_cache (по умолчанию True)
+                управляет использованием кэша ответов модели.
             
         Returns:
             Dict[str, Any]: Результат анализа.
         """
         logger.info(f"Запуск агента {self.__class__.__name__}")
         
+        use_cache = data.get("use_cache", True)
         if self.result_schema:
-            result = self.gigachat_service.call_agent_with_function(self.prompt, data, self.result_schema)
+            result = self.gigachat_service.call_agent_with_function(
+                self.prompt, data, self.result_schema, has_example=self.has_example, use_cache=use_cache
+            )
         else:
-            result = self.gigachat_service.call_agent_with_prompt(self.prompt, data)
+            result = self.gigachat_service.call_agent_with_prompt(self.prompt, data, use_cache=use_cache)
             
         logger.info(f"Агент {self.__class__.__name__} завершил работу")
         return result 
\ No newline at end of file
@@ -60,30 +60,33 @@ class PreprocessorAgent(CodeAnalysisAgent):
             'test_cases': test_cases
         }
         
+        use_cache = data.get('use_cache', True)
+        
         if story.strip():
-            processed_data['story'] = self._process_text('story', story)
+            processed_data['story'] = self._process_text('story', story, use_cache)
             
         if requirements.strip():
-            processed_data['requirements'] = self._process_text('requirements', requirements)
+            processed_data['requirements'] = self._process_text('requirements', requirements, use_cache)
             
         if code.strip():
-            processed_data['code'] = self._process_text('code', code)
+            processed_data['code'] = self._process_text('code', code, use_cache)
             
         if test_cases.strip():
-            processed_data['test_cases'] = self._process_text('test_cases', test_cases)
+            processed_data['test_cases'] = self._process_text('test_cases', test_cases, use_cache)
         
         processed_data['extreme_mode'] = data.get('extreme_mode', False)
         
         logger.info(f"Агент {self.__class__.__name__} завершил работу")
         return processed_data
     
-    def _process_text(self, field_name, text):
+    def _process_text(self, field_name, text, use_cache=True):
         """
         Обработка конкретного текстового поля.
         
         Args:
             field_name: Название поля (story, requirements, code, test_cases).
             text: Текст для обработки.
+            use_cache: Использовать ли кэш ответов модели.
             
         Returns:
             str: Обработанный текст.
@@ -96,7 +99,7 @@ class PreprocessorAgent(CodeAnalysisAgent):
                 'field_type': field_name
             }
             
-            response = self.gigachat_service.call_agent_with_prompt(self.prompt, data)
+            response = self.gigachat_service.call_agent_with_prompt(self.prompt, data, use_cache=use_cache)
             
             if isinstance(response, str):
                 processed_text = response
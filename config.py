@@ -12,6 +12,24 @@ AUTH_URL = os.getenv("AUTH_URL", "https://ngw.devices.sberbank.ru:9443/api/v2/oa
 GIGA_URL = os.getenv("GIGA_URL", "https://gigachat.devices.sberbank.ru/api/v1")
 MODEL = os.getenv("MODEL", "GigaChat-2-Pro")
 
+# Таймаут запроса к GigaChat в секундах
+GIGACHAT_TIMEOUT = float(os.getenv("GIGACHAT_TIMEOUT", 120))
+
+# Размер контекстного окна модели в токенах
+GIGACHAT_MAX_CONTEXT_TOKENS = int(os.getenv("GIGACHAT_MAX_CONTEXT_TOKENS", 128000))
+
+# Размер пула HTTP-соединений клиента GigaChat
+GIGACHAT_MAX_CONNECTIONS = int(os.getenv("GIGACHAT_MAX_CONNECTIONS", 64))
+
+# Максимальное число одновременных запросов к GigaChat
+GIGACHAT_RATE_LIMIT = int(os.getenv("GIGACHAT_RATE_LIMIT", 4))
+
+# Число элементов, объединяемых в один запрос в call_agent_batched
+GIGACHAT_MARSHAL_BATCH_SIZE = int(os.getenv("GIGACHAT_MARSHAL_BATCH_SIZE", 4))
+
+# Число ответов модели, хранимых в кэше сервиса (0 - кэш отключен)
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", 256))
+
 PORT = int(os.getenv("PORT", 8080))
 
 DEFAULT_STORY = "Требуется реализовать функционал согласно требованиям."
@@ -39,4 +57,16 @@ DEFAULT_REQUIREMENTS_GUIDELINES = """
 """
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
-LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s" 
\ No newline at end of file
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Интервал в секундах между сбросами буфера файла лога на диск
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 5))
+
+# Выводить лог в консоль, даже если stdout не подключен к терминалу
+FORCE_CONSOLE_LOG = os.getenv("FORCE_CONSOLE_LOG", "false").lower() in ("1", "true", "yes")
+
+# Записывать лог в формате JSON Lines вместо текстового LOG_FORMAT
+LOG_JSON = os.getenv("LOG_JSON", "false").lower() in ("1", "true", "yes")
+
+# Ротация лога созданием нового файла app.<время>.log вместо переименования app.log
+LOG_APPEND_ONLY = os.getenv("LOG_APPEND_ONLY", "false").lower() in ("1", "true", "yes")
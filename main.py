@@ -339,7 +339,8 @@ async def preprocess_data(request: AnalysisRequest):
             "requirements": request.requirements or "",
             "code": request.code or "",
             "test_cases": request.test_cases or "",
-            "extreme_mode": request.extreme_mode or False
+            "extreme_mode": request.extreme_mode or False,
+            "use_cache": request.use_cache if request.use_cache is not None else True
         }
         
         processed_data = preprocessor.analyze(data)
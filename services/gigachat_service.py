@@ -1,292 +1,1392 @@
 """
 Модуль для взаимодействия с GigaChat API.
 """
+import asyncio
+import copy
+import hashlib
 import json
 import logging
+import os
 import re
-from typing import Dict, Any, List, Type
+import string
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from types import MappingProxyType, UnionType
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple, Type, Union, get_args, get_origin
 
+import httpx
+from gigachat.exceptions import ResponseError
 from langchain_gigachat.chat_models import GigaChat
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_gigachat.tools.giga_tool import giga_tool as GigaChatTool
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
+from tenacity import RetryCallState, retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
 
 import config
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+# Значения метрик и результата анализа, возвращаемые при ошибках.
+# Шаблоны доступны только для чтения; копии создает _default_error
+_DEFAULT_METRICS = MappingProxyType({
+    "code_requirements_match": 0.0,
+    "test_requirements_match": 0.0,
+    "test_code_match": 0.0
+})
+
+_DEFAULT_RESULT = MappingProxyType({
+    "metrics": _DEFAULT_METRICS,
+    "bugs": (),
+    "vulnerabilities": (),
+    "recommendations": (),
+    "summary": "Не удалось извлечь результаты анализа. Пожалуйста, попробуйте еще раз."
+})
+
+
+class _DefaultResult(dict):
+    """
+    Результат со значениями по умолчанию, подставленный вместо ответа модели.
+    
+    Ведет себя как обычный словарь; отдельный тип позволяет отличить его от
+    разобранного ответа и не сохранять в кэш.
+    """
+
+
+def _default_error(message: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Создает результат анализа со значениями по умолчанию.
+    
+    Args:
+        message: Сообщение об ошибке. Если не задано, возвращается полный
+            шаблон результата анализа без поля error.
+        
+    Returns:
+        Dict[str, Any]: Новый словарь, который можно изменять.
+    """
+    if message is not None:
+        return {"metrics": dict(_DEFAULT_METRICS), "error": message}
+    
+    return _DefaultResult(
+        (key, dict(value) if isinstance(value, MappingProxyType) else list(value) if isinstance(value, tuple) else value)
+        for key, value in _DEFAULT_RESULT.items()
+    )
+
+
+# Неизменяемые сообщения пользователя, общие для всех вызовов
+_HUMAN_PREPROCESS = HumanMessage(content="Обработай предоставленный текст и верни обработанный результат.")
+_HUMAN_ANALYZE = HumanMessage(content="Выполни анализ предоставленных данных и верни результат в формате JSON.")
+_HUMAN_SCHEMA = HumanMessage(content="Выполни анализ предоставленных данных и верни результат в формате JSON в соответствии с указанной схемой. Убедись, что все поля имеют правильный формат и типы данных.")
+_HUMAN_NATIVE_SCHEMA = HumanMessage(content="Выполни анализ предоставленных данных и верни результат в соответствии со схемой.")
+_HUMAN_CONTINUE = HumanMessage(content="Продолжи диалог на основе предыдущих сообщений.")
+
+# Общий для всех потоков ограничитель числа одновременных запросов к GigaChat
+_RATE_LIMITER = threading.Semaphore(config.GIGACHAT_RATE_LIMIT)
+
+
+# Конструкции, которые принимает стандартный json, но может не принять orjson:
+# NaN, Infinity, числа вне диапазона double и целые числа шире 64 бит
+_JSON_STDLIB_ONLY_RE = re.compile(r'NaN|Infinity|[eE][+-]?\d{3,}|\d{19,}')
+
+
+def _loads(text: str) -> Any:
+    """
+    Разбор JSON через orjson, если он установлен, иначе через стандартный json.
+    
+    Если orjson отклонил текст, в котором есть NaN, Infinity, большие показатели
+    степени или длинные целые числа, текст повторно разбирается стандартным
+    модулем json. Остальные ошибки orjson передаются вызывающему коду без
+    повторного разбора.
+    
+    Raises:
+        json.JSONDecodeError: Если текст не является корректным JSON.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            if _JSON_STDLIB_ONLY_RE.search(text) is None:
+                raise
+    return json.loads(text)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    Определяет, имеет ли смысл повторять запрос после ошибки.
+    
+    Повторяются только временные ошибки: сетевые сбои, таймауты,
+    превышение лимита запросов (429) и ошибки сервера (5xx).
+    
+    Args:
+        error: Исключение, возникшее при вызове модели.
+        
+    Returns:
+        bool: True, если ошибка временная.
+    """
+    if isinstance(error, (httpx.TimeoutException, httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    
+    if not isinstance(error, ResponseError):
+        return False
+    
+    # SDK передает код ответа вторым аргументом исключения: (url, status_code, content, headers)
+    status_code = getattr(error, "status_code", None)
+    if status_code is None and len(error.args) > 1:
+        status_code = error.args[1]
+    
+    return isinstance(status_code, int) and (status_code == 429 or status_code >= 500)
+
+
+def _log_retry(retry_state: RetryCallState) -> None:
+    """
+    Логирует повторную попытку запроса к модели.
+    """
+    logger.info(
+        "Повторная попытка %s/%s через %.1f секунд после ошибки: %s",
+        retry_state.attempt_number + 1, _MAX_ATTEMPTS,
+        retry_state.next_action.sleep, retry_state.outcome.exception()
+    )
+
+
+# Число запросов к модели при временных ошибках и число повторных запросов
+# при ответах, которые не удалось разобрать
+_MAX_ATTEMPTS = 3
+_MAX_PROMPTS = 2
+
+# Число идущих подряд неудачных ответов в режиме структурированного вывода,
+# после которого сервис перестает его использовать
+_MAX_STRUCTURED_MISSES = 3
+
+# Общая политика повторов: экспоненциальная задержка со случайной добавкой,
+# чтобы одновременно упавшие вызовы не повторялись синхронно
+_retry_transient = retry(
+    stop=stop_after_attempt(_MAX_ATTEMPTS),
+    wait=wait_exponential_jitter(initial=2, max=16),
+    retry=retry_if_exception(_is_retryable),
+    before_sleep=_log_retry,
+    reraise=True,
+)
+
+
+_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*([\s\S]*?)\s*```')
+_JSON_TOKEN_RE = re.compile(r'[{}"\\]')
+
+
+class _JsonSpanScanner:
+    """
+    Инкрементальный поиск сбалансированного JSON-объекта в растущем тексте.
+    
+    Сканер учитывает строки и экранирование, поэтому фигурные скобки внутри
+    строковых значений не влияют на глубину вложенности. Все позиции задаются
+    относительно начала всего текста.
+    """
+    
+    __slots__ = ("pos", "start", "depth", "in_string", "length")
+    
+    def __init__(self):
+        self.pos = 0
+        self.start = -1
+        self.depth = 0
+        self.in_string = False
+        self.length = 0
+    
+    def feed(self, chunk: str) -> Optional[Tuple[int, int]]:
+        """
+        Сканирует очередной фрагмент текста, не собирая весь текст целиком.
+        
+        Args:
+            chunk: Фрагмент, дописанный в конец текста.
+            
+        Returns:
+            Optional[Tuple[int, int]]: Границы первого объекта верхнего уровня,
+            закрытого в этом фрагменте, или None. Остаток фрагмента после
+            найденного объекта сканируется через scan по всему тексту.
+        """
+        offset = self.length
+        self.length += len(chunk)
+        return self.scan(chunk, offset)
+    
+    def scan(self, text: str, offset: int = 0) -> Optional[Tuple[int, int]]:
+        """
+        Продолжает сканирование текста с места предыдущей остановки.
+        
+        Args:
+            text: Весь накопленный на данный момент текст или его конец.
+            offset: Позиция начала text во всем тексте.
+            
+        Returns:
+            Optional[Tuple[int, int]]: Границы очередного закрытого объекта верхнего
+            уровня или None, если объект еще не закрыт.
+        """
+        i = self.pos - offset
+        while True:
+            match = _JSON_TOKEN_RE.search(text, i)
+            if match is None:
+                break
+            i = match.start()
+            ch = text[i]
+            
+            if self.in_string:
+                if ch == "\\":
+                    i += 2
+                    continue
+                if ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = self.depth > 0
+            elif ch == "{":
+                if self.depth == 0:
+                    self.start = offset + i
+                self.depth += 1
+            elif ch == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.pos = offset + i + 1
+                    return self.start, self.pos
+            i += 1
+        
+        self.pos = offset + max(i, len(text))
+        return None
+
+
+_CONVERTERS = {"r": repr, "s": str, "a": ascii}
+
+
+@lru_cache(maxsize=32)
+def _compile_prompt(prompt: str) -> Callable[[Dict[str, Any]], str]:
+    """
+    Разбирает шаблон промпта один раз и возвращает функцию его заполнения.
+    
+    Результат функции совпадает с prompt.format(**data). Шаблоны с позиционными
+    полями, обращением к атрибутам или вложенными подстановками в спецификаторе
+    формата заполняются через str.format_map.
+    
+    Args:
+        prompt: Шаблон промпта с полями вида {name}.
+        
+    Returns:
+        Callable[[Dict[str, Any]], str]: Функция, заполняющая шаблон данными.
+    """
+    parts = []
+    for literal, field_name, format_spec, conversion in string.Formatter().parse(prompt):
+        if field_name is not None and (
+            not field_name.isidentifier() or "{" in (format_spec or "")
+        ):
+            return prompt.format_map
+        parts.append((literal, field_name, format_spec or "", _CONVERTERS.get(conversion)))
+    
+    def fill(data: Dict[str, Any]) -> str:
+        chunks = []
+        for literal, field_name, format_spec, converter in parts:
+            chunks.append(literal)
+            if field_name is not None:
+                value = data[field_name]
+                if converter is not None:
+                    value = converter(value)
+                chunks.append(format(value, format_spec))
+        return "".join(chunks)
+    
+    return fill
+
+
+_TRUNCATION_MARKER = "\n... [текст сокращен]"
+
+
+def _approx_tokens(text: str) -> int:
+    """
+    Грубая оценка числа токенов в тексте.
+    """
+    return len(text) // 4
+
+
+def _try_fill_prompt(prompt: str, data: Dict[str, Any]) -> Optional[str]:
+    """
+    Заполняет шаблон промпта данными без проверки размера контекста.
+    
+    Args:
+        prompt: Шаблон промпта.
+        data: Данные для заполнения промпта.
+        
+    Returns:
+        Optional[str]: Заполненный шаблон или None, если данные не подходят к шаблону.
+    """
+    try:
+        return _compile_prompt(prompt)(data)
+    except Exception:
+        return None
+
+
+def _fill_prompt(prompt: str, data: Dict[str, Any], suffix: str = "", filled: Optional[str] = None) -> str:
+    """
+    Заполняет промпт данными с учетом размера контекстного окна модели.
+    
+    Если заполненный промпт не помещается в контекст, самое длинное строковое
+    поле данных сокращается, а промпт заполняется повторно. Проверка выполняется
+    локально, до обращения к API.
+    
+    Args:
+        prompt: Шаблон промпта.
+        data: Данные для заполнения промпта.
+        suffix: Текст, добавляемый после заполненного промпта.
+        filled: Уже заполненный данными шаблон, чтобы не заполнять его повторно.
+        
+    Returns:
+        str: Заполненный промпт.
+    """
+    if filled is None:
+        filled = _compile_prompt(prompt)(data)
+    filled_prompt = filled + suffix
+    excess = _approx_tokens(filled_prompt) - (config.GIGACHAT_MAX_CONTEXT_TOKENS - 1024)
+    if excess <= 0:
+        return filled_prompt
+    
+    text_fields = [key for key, value in data.items() if isinstance(value, str)]
+    if not text_fields:
+        return filled_prompt
+    
+    key = max(text_fields, key=lambda k: len(data[k]))
+    keep = max(len(data[key]) - excess * 4 - len(_TRUNCATION_MARKER), 0)
+    logger.warning(
+        "Промпт превышает размер контекста модели, поле %s сокращено с %s до %s символов",
+        key, len(data[key]), keep
+    )
+    
+    return _compile_prompt(prompt)({**data, key: data[key][:keep] + _TRUNCATION_MARKER}) + suffix
+
+
+def _join_batch_items(field_names: List[str], batch: List[Dict[str, Any]], reserved_tokens: int) -> Optional[str]:
+    """
+    Объединяет элементы пакета в одно сообщение с учетом размера контекста модели.
+    
+    Если сообщение не помещается в контекст, самое длинное поле среди всех
+    элементов пакета сокращается, пока сообщение не уложится в лимит.
+    
+    Args:
+        field_names: Имена полей промпта, выводимых для каждого элемента.
+        batch: Наборы данных элементов пакета.
+        reserved_tokens: Число токенов, уже занятых системным сообщением.
+        
+    Returns:
+        Optional[str]: Текст сообщения или None, если пакет не удается уместить в контекст.
+    """
+    items = [{name: str(data.get(name, '')) for name in field_names} for data in batch]
+    budget = config.GIGACHAT_MAX_CONTEXT_TOKENS - 1024 - reserved_tokens
+    
+    while True:
+        text = "\n\n".join(
+            f"<<ITEM id={index}>>\n"
+            + "\n".join(f"{name}:\n{item[name]}" for name in field_names)
+            + "\n<<END>>"
+            for index, item in enumerate(items)
+        )
+        excess = _approx_tokens(text) - budget
+        if excess <= 0:
+            return text
+        
+        index, key = max(
+            ((index, name) for index, item in enumerate(items) for name in field_names),
+            key=lambda position: len(items[position[0]][position[1]]),
+            default=(None, None)
+        )
+        if key is None or len(items[index][key]) <= len(_TRUNCATION_MARKER):
+            return None
+        
+        value = items[index][key]
+        keep = max(len(value) - excess * 4 - len(_TRUNCATION_MARKER), 0)
+        logger.warning(
+            "Пакетный запрос превышает размер контекста модели, поле %s элемента %s сокращено с %s до %s символов",
+            key, index, len(value), keep
+        )
+        items[index][key] = value[:keep] + _TRUNCATION_MARKER
+
+
+def _annotation_tag(annotation: Any) -> str:
+    """
+    Определяет категорию типа поля схемы.
+    
+    Args:
+        annotation: Аннотация типа поля.
+        
+    Returns:
+        str: Одна из категорий 'float', 'int', 'str', 'list', 'list_of_dict',
+        'list_of_str', 'dict' или 'other'.
+    """
+    origin = get_origin(annotation)
+    
+    if origin is None:
+        if not isinstance(annotation, type) or issubclass(annotation, bool):
+            return "other"
+        if issubclass(annotation, BaseModel):
+            return "dict"
+        for base in (str, float, int, list, dict):
+            if issubclass(annotation, base):
+                return base.__name__
+        return "other"
+    
+    # Optional[X] и X | None определяются по типу X; объединение разных
+    # типов не относится ни к одной категории
+    if origin is Union or origin is UnionType:
+        tags = {_annotation_tag(arg) for arg in get_args(annotation) if arg is not type(None)}
+        return tags.pop() if len(tags) == 1 else "other"
+    
+    if origin is list:
+        args = get_args(annotation)
+        item = args[0] if args else None
+        if item is dict or get_origin(item) is dict or (isinstance(item, type) and issubclass(item, BaseModel)):
+            return "list_of_dict"
+        if item is str:
+            return "list_of_str"
+        return "list"
+    
+    if origin is dict:
+        return "dict"
+    
+    return "other"
+
+
+@lru_cache(maxsize=128)
+def _schema_field_tags(schema_class: Type[BaseModel]) -> Dict[str, str]:
+    """
+    Возвращает категории типов всех полей схемы Pydantic.
+    
+    Args:
+        schema_class: Класс схемы Pydantic.
+        
+    Returns:
+        Dict[str, str]: Категория типа для каждого поля схемы.
+    """
+    return {
+        field_name: _annotation_tag(field.annotation)
+        for field_name, field in schema_class.model_fields.items()
+    }
+
+
+def _create_example_from_schema(schema_class: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    Создает пример данных на основе схемы Pydantic.
+    
+    Args:
+        schema_class: Класс схемы Pydantic.
+    
+    Returns:
+        Dict[str, Any]: Пример данных.
+    """
+    example = {}
+    
+    for field_name, tag in _schema_field_tags(schema_class).items():
+        if tag == "float":
+            example[field_name] = 75.5
+        elif tag == "int":
+            example[field_name] = 42
+        elif tag == "str":
+            example[field_name] = f"Пример текста для поля {field_name}"
+        elif tag == "list_of_dict":
+            example[field_name] = [{"key": "value", "example": "value"}]
+        elif tag == "list_of_str":
+            example[field_name] = ["Пример элемента списка 1", "Пример элемента списка 2"]
+        elif tag == "list":
+            example[field_name] = ["Пример элемента списка"]
+        elif tag == "dict":
+            example[field_name] = {"key": "value", "example": "value"}
+        else:
+            example[field_name] = "Пример данных"
+    
+    return example
+
+
+@lru_cache(maxsize=128)
+def _schema_json_cached(schema_class: Type[BaseModel]) -> str:
+    """
+    Возвращает сериализованную JSON-схему модели Pydantic.
+    
+    Схема сериализуется без отступов и пробелов: модели форматирование не нужно,
+    а компактная запись заметно сокращает число токенов в промпте.
+    
+    Args:
+        schema_class: Класс схемы Pydantic.
+        
+    Returns:
+        str: JSON-схема в виде строки.
+    """
+    return json.dumps(schema_class.model_json_schema(), ensure_ascii=False, separators=(",", ":"))
+
+
+@lru_cache(maxsize=128)
+def _example_json_cached(schema_class: Type[BaseModel]) -> str:
+    """
+    Возвращает сериализованный пример данных для схемы Pydantic.
+    
+    Args:
+        schema_class: Класс схемы Pydantic.
+        
+    Returns:
+        str: Пример данных в виде JSON-строки.
+    """
+    return json.dumps(_create_example_from_schema(schema_class), ensure_ascii=False, indent=2)
+
+
+@lru_cache(maxsize=1)
+def _get_giga() -> GigaChat:
+    """
+    Возвращает единственный на процесс клиент GigaChat.
+    
+    Клиент держит открытую HTTP-сессию с пулом keep-alive соединений
+    (размер задается config.GIGACHAT_MAX_CONNECTIONS) и полученный OAuth-токен,
+    поэтому повторное создание сервиса не приводит к новой авторизации
+    и TLS-рукопожатию.
+    
+    langchain-gigachat не передает max_connections в SDK, поэтому размер пула
+    задается через переменную окружения GIGACHAT_MAX_CONNECTIONS. Это
+    глобальный побочный эффект: значение записывается в os.environ всего
+    процесса (только если переменная еще не задана) и действует на все
+    клиенты gigachat, созданные после этого вызова.
+    
+    Returns:
+        GigaChat: Настроенный клиент GigaChat.
+    """
+    # SDK читает настройки из переменных окружения с префиксом GIGACHAT_
+    os.environ.setdefault("GIGACHAT_MAX_CONNECTIONS", str(config.GIGACHAT_MAX_CONNECTIONS))
+    
+    return GigaChat(
+        credentials=config.AUTH_KEY,
+        base_url=config.GIGA_URL if config.GIGA_URL else None,
+        auth_url=config.AUTH_URL if config.AUTH_URL else None,
+        model=config.MODEL,
+        timeout=config.GIGACHAT_TIMEOUT,
+        verify_ssl_certs=False
+    )
+
 
 class GigaChatService:
     """
     Сервис для взаимодействия с GigaChat API.
     """
 
-    def __init__(self):
+    __slots__ = ("giga", "_structured_unsupported", "_structured_misses", "_structured_cache", "_cache", "_cache_lock")
+
+    def __init__(self):
+        """
+        Инициализация сервиса GigaChat.
+        """
+        self.giga = None
+        self._structured_unsupported = False
+        self._structured_misses = 0
+        self._structured_cache: Dict[Type[BaseModel], Any] = {}
+        self._cache: OrderedDict[str, Any] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.init_giga()
+
+    def init_giga(self):
+        """
+        Инициализация клиента GigaChat.
+        """
+        try:
+            logger.info("Инициализация GigaChat клиента")
+            self.giga = _get_giga()
+            self._structured_cache = {}
+            logger.info("GigaChat клиент успешно инициализирован")
+        except Exception as e:
+            logger.error("Ошибка при инициализации GigaChat клиента: %s", e)
+            raise
+
+    def _structured_llm(self, result_schema: Type[BaseModel]) -> Any:
+        """
+        Возвращает модель, привязанную к схеме структурированного вывода.
+        
+        Привязка создается один раз для каждой схемы и переиспользуется.
+        
+        Args:
+            result_schema: Схема ожидаемого результата.
+            
+        Returns:
+            Any: Модель со структурированным выводом.
+        """
+        structured_llm = self._structured_cache.get(result_schema)
+        if structured_llm is None:
+            structured_llm = self._structured_cache.setdefault(
+                result_schema, self.giga.with_structured_output(result_schema)
+            )
+        return structured_llm
+
+    def _cache_key(
+        self,
+        filled: Optional[str],
+        result_schema: Optional[Type[BaseModel]] = None,
+        validate: bool = False,
+        has_example: bool = False
+    ) -> Optional[str]:
+        """
+        Ключ кэша ответов для заполненного промпта и параметров вызова.
+        
+        Args:
+            filled: Заполненный данными шаблон промпта или None, если промпт не заполняется.
+            result_schema: Схема ожидаемого результата или None для вызова без схемы.
+            validate: Выполняется ли полная валидация результата.
+            has_example: Содержит ли промпт собственный пример ответа.
+            
+        Returns:
+            Optional[str]: Ключ кэша или None, если кэш отключен либо промпт не заполняется.
+        """
+        if filled is None or config.LLM_CACHE_SIZE <= 0:
+            return None
+        schema_name = f"{result_schema.__module__}.{result_schema.__qualname__}" if result_schema else ""
+        return "%s:%s:%d:%d" % (
+            hashlib.blake2b(filled.encode(), digest_size=16).hexdigest(),
+            schema_name, validate, has_example
+        )
+
+    def _cache_get(self, key: Optional[str]) -> Any:
+        """
+        Получение ответа из кэша.
+        
+        Args:
+            key: Ключ кэша.
+            
+        Returns:
+            Any: Копия сохраненного ответа или None при промахе.
+        """
+        if key is None:
+            return None
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is None:
+                return None
+            self._cache.move_to_end(key)
+        logger.info("Ответ GigaChat получен из кэша")
+        return copy.deepcopy(result)
+
+    def _cache_put(self, key: Optional[str], result: Any) -> None:
+        """
+        Сохранение успешного ответа в кэш с вытеснением самых старых записей.
+        
+        Ошибки и значения по умолчанию, подставленные вместо неразобранного
+        ответа, не сохраняются.
+        
+        Args:
+            key: Ключ кэша.
+            result: Ответ модели.
+        """
+        if key is None or result is None or isinstance(result, _DefaultResult):
+            return
+        if isinstance(result, dict) and "error" in result:
+            return
+        result = copy.deepcopy(result)
+        with self._cache_lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > config.LLM_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    @_retry_transient
+    def _invoke_once(self, call: Callable[[], Any]) -> Any:
+        """
+        Выполняет обращение к модели с повтором при временных ошибках.
+        
+        Args:
+            call: Функция, выполняющая запрос к модели.
+            
+        Returns:
+            Any: Результат запроса.
+        """
+        return call()
+
+    @_retry_transient
+    async def _ainvoke_once(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Асинхронный вариант _invoke_once.
+        
+        Args:
+            call: Функция, возвращающая корутину запроса к модели.
+            
+        Returns:
+            Any: Результат запроса.
+        """
+        return await call()
+
+    def extract_json_from_text(self, text: str) -> Dict[str, Any]:
+        """
+        Извлечение JSON из текстового ответа.
+        
+        Args:
+            text: Текстовый ответ, содержащий JSON.
+            
+        Returns:
+            Dict[str, Any]: Извлеченный JSON или словарь с ошибкой.
+        """
+        try:
+            # Ответ, состоящий только из JSON, разбираем без регулярных выражений
+            stripped = text.strip()
+            if stripped.startswith("{"):
+                try:
+                    return _loads(stripped)
+                except json.JSONDecodeError:
+                    pass
+            
+            # Блоки ```json - более надежный признак того, что модель следовала
+            # инструкциям по формату, поэтому проверяем их первыми
+            for block_match in _CODE_BLOCK_RE.finditer(text):
+                try:
+                    return _loads(block_match.group(1).strip())
+                except json.JSONDecodeError:
+                    continue
+            
+            # Однопроходный поиск сбалансированных объектов вместо жадного
+            # регулярного выражения, которое на длинных ответах дает откаты
+            scanner = _JsonSpanScanner()
+            span = scanner.scan(text)
+            while span is not None:
+                try:
+                    return _loads(text[span[0]:span[1]])
+                except json.JSONDecodeError:
+                    span = scanner.scan(text)
+            
+            logger.warning("Не удалось извлечь JSON из ответа GigaChat. Возвращаем значения по умолчанию.")
+            return _default_error()
+        except Exception as e:
+            logger.error("Ошибка при извлечении JSON: %s", e)
+            return _default_error(str(e))
+
+    def call_agent_with_prompt(self, prompt: str, data: Dict[str, Any], *, use_cache: bool = True) -> Any:
+        """
+        Вызов агента с заданным промптом и данными.
+        
+        Args:
+            prompt: Промпт для агента.
+            data: Данные для заполнения промпта.
+            use_cache: Использовать ли кэш ответов модели.
+            
+        Returns:
+            Any: Результат работы агента (текст или словарь с JSON).
+        """
+        filled = _try_fill_prompt(prompt, data)
+        key = self._cache_key(filled) if use_cache else None
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        try:
+            messages, is_preprocessor = self._prompt_messages(prompt, data, filled)
+            
+            logger.info("Вызов GigaChat для анализа")
+            if is_preprocessor:
+                result = self.giga.invoke(messages).content
+            else:
+                result = self._prompt_result(self._stream_json(messages))
+        except Exception as e:
+            return self._prompt_error(data, e)
+        
+        self._cache_put(key, result)
+        return result
+
+    def _prompt_messages(self, prompt: str, data: Dict[str, Any], filled: Optional[str] = None) -> Tuple[List[Any], bool]:
+        """
+        Формирование сообщений для call_agent_with_prompt.
+        
+        Args:
+            prompt: Промпт для агента.
+            data: Данные для заполнения промпта.
+            filled: Уже заполненный данными шаблон промпта.
+            
+Returns:
+            Tuple[List[Any], bool]: Сообщения для модели и признак запроса предобработки.
+        """
+        system_message = SystemMessage(content=_fill_prompt(prompt, data, filled=filled))
+        is_preprocessor = 'field_type' in data and 'text' in data
+        
+        if is_preprocessor:
+            human_message = _HUMAN_PREPROCESS
+        else:
+            human_message = _HUMAN_ANALYZE
+        
+        return [system_message, human_message], is_preprocessor
+
+    def _prompt_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Обработка разобранного ответа модели для call_agent_with_prompt.
+        
+        Args:
+            result: JSON, извлеченный из ответа модели.
+            
+        Returns:
+            Dict[str, Any]: Результат анализа.
+        """
+        if "error" not in result:
+            logger.info("Успешно получен результат анализа в формате JSON")
+        
+        return result
+
+    def _prompt_error(self, data: Dict[str, Any], error: Exception) -> Any:
+        """
+        Результат call_agent_with_prompt при ошибке вызова модели.
+        
+        Args:
+            data: Данные, с которыми вызывался агент.
+            error: Возникшее исключение.
+            
+        Returns:
+            Any: Исходный текст для предобработки или словарь с ошибкой.
+        """
+        logger.error("Ошибка при вызове агента: %s", error)
+        
+        if 'field_type' in data and 'text' in data:
+            return data.get('text', '')
+        
+        return _default_error(str(error))
+
+    def call_agent_with_function(self, prompt: str, data: Dict[str, Any], result_schema: Type[BaseModel], validate: bool = False, *, has_example: bool = False, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Вызов агента с заданным промптом, данными и схемой ожидаемого результата.
+        
+        По умолчанию ответ модели, уже приведенный к форме схемы, собирается через
+        model_construct без полной валидации Pydantic. Для непроверенных источников
+        используйте call_agent_with_function_validated.
+        
+        Args:
+            prompt: Промпт для агента.
+            data: Данные для заполнения промпта.
+            result_schema: Схема ожидаемого результата.
+            validate: Выполнять ли полную валидацию результата через model_validate.
+            has_example: Содержит ли промпт собственный пример ответа в формате JSON.
+            use_cache: Использовать ли кэш ответов модели.
+            
+        Returns:
+            Dict[str, Any]: Результат работы агента в формате JSON.
+        """
+        filled = _try_fill_prompt(prompt, data)
+        key = self._cache_key(filled, result_schema, validate, has_example) if use_cache else None
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        result = self._call_agent_with_function(prompt, data, result_schema, validate, has_example, filled)
+        self._cache_put(key, result)
+        return result
+
+    def _call_agent_with_function(self, prompt: str, data: Dict[str, Any], result_schema: Type[BaseModel], validate: bool, has_example: bool, filled: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Вызов агента со схемой результата без обращения к кэшу ответов.
+        
+        Args:
+            prompt: Промпт для агента.
+            data: Данные для заполнения промпта.
+            result_schema: Схема ожидаемого результата.
+            validate: Выполнять ли полную валидацию результата через model_validate.
+            has_example: Содержит ли промпт собственный пример ответа в формате JSON.
+            filled: Уже заполненный данными шаблон промпта.
+            
+        Returns:
+            Dict[str, Any]: Результат работы агента в формате JSON.
+        """
+        if not self._structured_unsupported:
+            result = self._call_with_native_schema(prompt, data, result_schema, filled)
+            if result is not None:
+                return result
+        
+        # Промпт со схемой не зависит от номера попытки, поэтому собираем его один раз
+        try:
+            messages = self._function_messages(prompt, data, result_schema, has_example, filled)
+        except Exception as e:
+            logger.error("Ошибка при подготовке промпта агента: %s", e)
+            return _default_error(str(e))
+        
+        # Временные сбои повторяются внутри _invoke_once. Ошибки разбора и
+        # несоответствия схеме не исчезают сами по себе: даем модели одну
+        # немедленную повторную попытку и завершаем работу
+        for attempt in range(_MAX_PROMPTS):
+            try:
+                logger.info("Вызов GigaChat в текстовом режиме (попытка %s/%s), ожидаемая схема: %s", attempt + 1, _MAX_PROMPTS, result_schema.__name__)
+                result = self._invoke_once(lambda: self._stream_json(messages))
+                
+                if "error" not in result:
+                    logger.info("Успешно получен результат анализа в формате JSON")
+                    return self._coerce_function_result(result, result_schema, validate)
+                else:
+                    logger.warning("Ошибка при извлечении результата: %s", result.get('error'))
+                    
+            except Exception as e:
+                logger.error("Ошибка при вызове агента (попытка %s/%s): %s", attempt + 1, _MAX_PROMPTS, e)
+                
+                if _is_retryable(e):
+                    logger.error("Все %s попытки вызова агента завершились неудачно", _MAX_ATTEMPTS)
+                    return _default_error(f"Не удалось получить ответ от GigaChat после {_MAX_ATTEMPTS} попыток")
+        
+        logger.error("Повторный запрос не исправил ответ модели, дальнейшие попытки прекращены")
+        return _default_error("Ответ GigaChat не удалось привести к ожидаемой схеме")
+        
+    def _function_messages(self, prompt: str, data: Dict[str, Any], result_schema: Type[BaseModel], has_example: bool, filled: Optional[str] = None) -> List[Any]:
+        """
+        Формирование сообщений для текстового режима call_agent_with_function.
+        
+        Args:
+            prompt: Промпт для агента.
+            data: Данные для заполнения промпта.
+            result_schema: Схема ожидаемого результата.
+            has_example: Содержит ли промпт собственный пример ответа в формате JSON.
+            filled: Уже заполненный данными шаблон промпта.
+        
+        Returns:
+            List[Any]: Сообщения для модели со встроенной в промпт JSON-схемой.
+        """
+        # Получаем JSON-схему из модели Pydantic
+        schema_json = _schema_json_cached(result_schema)
+        
+        # Создаем более подробные инструкции для модели
+        schema_info = f"\n\nОтвет должен строго соответствовать следующей JSON-схеме:\n```json\n{schema_json}\n```\n"
+        schema_info += f"\nВажно! Ответ должен быть в формате JSON с правильными типами данных. Если в схеме указано, что поле должно быть object или array, не возвращай строки."
+        
+        # Пример из схемы добавляем, только если в промпте нет собственного
+        if not has_example:
+            schema_info += f"\n\nПример правильного формата ответа:\n```json\n{_example_json_cached(result_schema)}\n```"
+        
+        filled_prompt = _fill_prompt(prompt, data, schema_info, filled)
+        
+        system_message = SystemMessage(content=filled_prompt)
+        human_message = _HUMAN_SCHEMA
+        
+        return [system_message, human_message]
+
+    def _coerce_function_result(self, result: Dict[str, Any], result_schema: Type[BaseModel], validate: bool) -> Dict[str, Any]:
+        """
+        Приведение разобранного ответа модели к форме схемы.
+        
+        Args:
+            result: JSON, извлеченный из ответа модели.
+            result_schema: Схема ожидаемого результата.
+            validate: Выполнять ли полную валидацию результата через model_validate.
+        
+        Returns:
+            Dict[str, Any]: Результат, соответствующий схеме.
+        """
+        # Проверяем наличие всех обязательных полей
+        model_fields = result_schema.model_fields
+        field_tags = _schema_field_tags(result_schema)
+        missing_fields = []
+        
+        for field_name, field in model_fields.items():
+            if field.is_required() and field_name not in result:
+                missing_fields.append(field_name)
+                # Добавляем значение по умолчанию
+                tag = field_tags[field_name]
+                if tag == "float":
+                    result[field_name] = 0.0
+                elif tag == "int":
+                    result[field_name] = 0
+                elif tag == "str":
+                    result[field_name] = ""
+                elif tag.startswith("list"):
+                    result[field_name] = []
+                elif tag == "dict":
+                    result[field_name] = {}
+        
+        if missing_fields:
+            logger.warning("В ответе модели отсутствуют обязательные поля: %s", missing_fields)
+        
+        # Проверяем типы данных полей
+        for field_name, value in result.items():
+            tag = field_tags.get(field_name)
+            if tag is None or not isinstance(value, str):
+                continue
+            
+            # Преобразование типов при необходимости
+            if tag.startswith("list"):
+                logger.warning("Поле %s ожидается списком, но получена строка. Попытка преобразования.", field_name)
+                result[field_name] = [value]
+            elif tag == "dict":
+                logger.warning("Поле %s ожидается словарем, но получена строка. Попытка преобразования.", field_name)
+                result[field_name] = {"value": value}
+        
+        if validate:
+            coerced = result_schema.model_validate(result).model_dump()
+        else:
+            coerced = result_schema.model_construct(**result).model_dump(warnings=False)
+        
+        # Признак подстановки значений по умолчанию сохраняется для кэша
+        if isinstance(result, _DefaultResult):
+            return _DefaultResult(coerced)
+        return coerced
+
+    def _stream_json(self, messages: List[Any]) -> Dict[str, Any]:
+        """
+        Потоковое получение ответа модели с разбором JSON по мере поступления.
+        
+        Чтение потока прекращается, как только первый JSON-объект ответа закрыт
+        и успешно разобран. Если такого объекта нет, весь ответ передается
+        в extract_json_from_text.
+        
+        Args:
+            messages: Сообщения для модели.
+            
+        Returns:
+            Dict[str, Any]: Извлеченный JSON или словарь с ошибкой.
+        """
+        parts: List[str] = []
+        scanner = _JsonSpanScanner()
+        stream = self.giga.stream(messages)
+        
+        try:
+            for chunk in stream:
+                result = self._feed_stream_chunk(parts, scanner, chunk.content)
+                if result is not None:
+                    return result
+        finally:
+            stream.close()
+        
+        return self.extract_json_from_text("".join(parts))
+
+    async def _astream_json(self, messages: List[Any]) -> Dict[str, Any]:
         """
-        Инициализация сервиса GigaChat.
+        Асинхронный вариант _stream_json.
+        
+        Args:
+            messages: Сообщения для модели.
+            
+        Returns:
+            Dict[str, Any]: Извлеченный JSON или словарь с ошибкой.
         """
-        self.giga = None
-        self.init_giga()
+        parts: List[str] = []
+        scanner = _JsonSpanScanner()
+        stream = self.giga.astream(messages)
+        
+        try:
+            async for chunk in stream:
+                result = self._feed_stream_chunk(parts, scanner, chunk.content)
+                if result is not None:
+                    return result
+        finally:
+            await stream.aclose()
+        
+        return self.extract_json_from_text("".join(parts))
 
-    def init_giga(self):
+    def _feed_stream_chunk(self, parts: List[str], scanner: _JsonSpanScanner, content: str) -> Optional[Dict[str, Any]]:
         """
-        Инициализация клиента GigaChat.
+        Добавляет фрагмент потока к ответу и пытается разобрать закрытые JSON-объекты.
+        
+        Сканер обрабатывает только новый фрагмент, а текст ответа собирается
+        в одну строку лишь тогда, когда в нем закрылся объект верхнего уровня.
+        
+        Args:
+            parts: Накопленные фрагменты текста ответа.
+            scanner: Сканер, хранящий состояние разбора между фрагментами.
+            content: Очередной фрагмент ответа модели.
+            
+        Returns:
+            Optional[Dict[str, Any]]: Первый успешно разобранный объект или None.
         """
-        try:
-            logger.info("Инициализация GigaChat клиента")
-            self.giga = GigaChat(
-                credentials=config.AUTH_KEY,
-                base_url=config.GIGA_URL if config.GIGA_URL else None,
-                auth_url=config.AUTH_URL if config.AUTH_URL else None,
-                model=config.MODEL,
-                verify_ssl_certs=False            
-                )
-            logger.info("GigaChat клиент успешно инициализирован")
-        except Exception as e:
-            logger.error(f"Ошибка при инициализации GigaChat клиента: {e}")
-            raise
+        if not content:
+            return None
+        
+        parts.append(content)
+        span = scanner.feed(content)
+        if span is None:
+            return None
+        
+        text = "".join(parts)
+        parts[:] = [text]
+        while span is not None:
+            try:
+                result = _loads(text[span[0]:span[1]])
+                if isinstance(result, dict):
+                    return result
+            except json.JSONDecodeError:
+                pass
+            span = scanner.scan(text)
+        
+        return None
 
-    def extract_json_from_text(self, text: str) -> Dict[str, Any]:
+    def _call_with_native_schema(self, prompt: str, data: Dict[str, Any], result_schema: Type[BaseModel], filled: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
-        Извлечение JSON из текстового ответа.
+        Вызов агента через нативный структурированный вывод модели без текста схемы в промпте.
         
         Args:
-            text: Текстовый ответ, содержащий JSON.
+            prompt: Промпт для агента.
+            data: Данные для заполнения промпта.
+            result_schema: Схема ожидаемого результата.
+            filled: Уже заполненный данными шаблон промпта.
             
         Returns:
-            Dict[str, Any]: Извлеченный JSON или словарь с ошибкой.
+            Optional[Dict[str, Any]]: Результат работы агента или None, если нужно
+            использовать текстовый режим.
         """
         try:
-            json_match = re.search(r'({[\s\S]*})', text)
-            
-            if json_match:
-                json_text = json_match.group(1)
-                try:
-                    return json.loads(json_text)
-                except json.JSONDecodeError:
-                    code_blocks = re.findall(r'```(?:json)?\s*([\s\S]*?)\s*```', text)
-                    if code_blocks:
-                        for block in code_blocks:
-                            try:
-                                return json.loads(block.strip())
-                            except json.JSONDecodeError:
-                                continue
+            structured_llm = self._structured_llm(result_schema)
+        except Exception as e:
+            return self._native_schema_failed(e, binding=True)
+        
+        try:
+            messages = self._native_schema_messages(prompt, data, filled)
             
-            logger.warning("Не удалось извлечь JSON из ответа GigaChat. Возвращаем значения по умолчанию.")
-            return {
-                "metrics": {
-                    "code_requirements_match": 0.0,
-                    "test_requirements_match": 0.0,
-                    "test_code_match": 0.0
-                },
-                "bugs": [],
-                "vulnerabilities": [],
-                "recommendations": [],
-                "summary": "Не удалось извлечь результаты анализа. Пожалуйста, попробуйте еще раз."
-            }
+            logger.info("Вызов GigaChat со структурированным выводом, ожидаемая схема: %s", result_schema.__name__)
+            return self._native_schema_result(self._invoke_once(lambda: structured_llm.invoke(messages)))
         except Exception as e:
-            logger.error(f"Ошибка при извлечении JSON: {e}")
-            return {
-                "metrics": {
-                    "code_requirements_match": 0.0,
-                    "test_requirements_match": 0.0,
-                    "test_code_match": 0.0
-                },
-                "error": str(e)
-            }
+            return self._native_schema_failed(e)
 
-    def call_agent_with_prompt(self, prompt: str, data: Dict[str, Any]) -> Any:
+    def _native_schema_messages(self, prompt: str, data: Dict[str, Any], filled: Optional[str] = None) -> List[Any]:
         """
-        Вызов агента с заданным промптом и данными.
+        Формирование сообщений для нативного структурированного вывода.
         
         Args:
             prompt: Промпт для агента.
             data: Данные для заполнения промпта.
+            filled: Уже заполненный данными шаблон промпта.
+            
+Returns:
+            List[Any]: Сообщения для модели без текста JSON-схемы.
+        """
+        system_message = SystemMessage(content=_fill_prompt(prompt, data, filled=filled))
+        human_message = _HUMAN_NATIVE_SCHEMA
+        return [system_message, human_message]
+
+    def _native_schema_result(self, result: Optional[BaseModel]) -> Optional[Dict[str, Any]]:
+        """
+        Обработка ответа модели в режиме нативного структурированного вывода.
+        
+        Args:
+            result: Pydantic-объект, возвращенный моделью.
             
         Returns:
-            Any: Результат работы агента (текст или словарь с JSON).
+            Optional[Dict[str, Any]]: Результат в виде словаря или None.
         """
-        try:
-            filled_prompt = prompt.format(**data)
-            system_message = SystemMessage(content=filled_prompt)
-            is_preprocessor = 'field_type' in data and 'text' in data
+        if result is None:
+            logger.warning("Модель не вернула структурированный ответ. Переход в текстовый режим.")
+            self._structured_miss()
+            return None
+        
+        logger.info("Успешно получен структурированный ответ")
+        self._structured_misses = 0
+        return result.model_dump()
+
+    def _structured_miss(self):
+        """
+        Учет неудачного ответа в режиме структурированного вывода.
+        
+        Каждый такой ответ стоит лишнего запроса к модели перед текстовым режимом,
+        поэтому после _MAX_STRUCTURED_MISSES неудач подряд сервис перестает
+        использовать структурированный вывод.
+        """
+        self._structured_misses += 1
+        if self._structured_misses >= _MAX_STRUCTURED_MISSES and not self._structured_unsupported:
+            logger.warning("Структурированный вывод не дал результата %s раз подряд. Далее используется текстовый режим.", self._structured_misses)
+            self._structured_unsupported = True
+
+    def _native_schema_failed(self, error: Exception, binding: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Обработка ошибки нативного структурированного вывода.
+        
+        Если модель не поддерживает структурированный вывод (ошибка привязки схемы
+        или NotImplementedError), сервис запоминает это и в дальнейшем сразу
+        использует текстовый режим. Ошибки разбора и валидации ответа переводят
+        в текстовый режим текущий вызов, а после _MAX_STRUCTURED_MISSES таких
+        ошибок подряд - и все последующие. Временные ошибки, не устраненные
+        повторными попытками, завершают вызов без дополнительных запросов.
+        
+        Args:
+            error: Возникшее исключение.
+            binding: Возникла ли ошибка при привязке схемы к модели.
             
-            if is_preprocessor:
-                human_message = HumanMessage(content="Обработай предоставленный текст и верни обработанный результат.")
+        Returns:
+            Optional[Dict[str, Any]]: Результат с ошибкой или None, если нужно
+            использовать текстовый режим.
+        """
+        if binding or isinstance(error, NotImplementedError):
+            logger.warning("Структурированный вывод не поддерживается моделью: %s. Используется текстовый режим.", error)
+            self._structured_unsupported = True
+        elif _is_retryable(error):
+            logger.error("Все %s попытки вызова модели со структурированным выводом завершились неудачно: %s", _MAX_ATTEMPTS, error)
+            return _default_error(f"Не удалось получить ответ от GigaChat после {_MAX_ATTEMPTS} попыток")
+        elif isinstance(error, (ValidationError, ValueError)):
+            logger.warning("Структурированный ответ не удалось разобрать: %s. Переход в текстовый режим.", error)
+            self._structured_miss()
+        else:
+            logger.error("Ошибка при вызове модели со структурированным выводом: %s. Переход в текстовый режим.", error)
+            self._structured_miss()
+        return None
+
+    def call_agents_parallel(
+        self,
+        specs: List[Union[
+            Tuple[str, Dict[str, Any], Optional[Type[BaseModel]]],
+            Tuple[str, Dict[str, Any], Optional[Type[BaseModel]], bool]
+        ]]
+    ) -> List[Any]:
+        """
+        Параллельный вызов нескольких независимых агентов.
+        
+        Args:
+            specs: Список кортежей (промпт, данные, схема результата или None)
+                с необязательным четвертым элементом has_example. Если он не
+                указан, наличие примера ответа определяется один раз для
+                каждого промпта.
+            
+        Returns:
+            List[Any]: Результаты работы агентов в порядке исходного списка.
+        """
+        if not specs:
+            return []
+        
+        has_example_by_prompt: Dict[str, bool] = {}
+        calls = []
+        for spec in specs:
+            prompt, data, result_schema = spec[:3]
+            if len(spec) > 3:
+                has_example = spec[3]
             else:
-                human_message = HumanMessage(content="Выполни анализ предоставленных данных и верни результат в формате JSON.")
+                has_example = has_example_by_prompt.get(prompt)
+                if has_example is None:
+                    has_example = has_example_by_prompt[prompt] = "```json" in prompt
+            calls.append((prompt, data, result_schema, has_example))
+        
+        def run(prompt: str, data: Dict[str, Any], result_schema: Optional[Type[BaseModel]], has_example: bool) -> Any:
+            with _RATE_LIMITER:
+                if result_schema:
+                    return self.call_agent_with_function(prompt, data, result_schema, has_example=has_example)
+                return self.call_agent_with_prompt(prompt, data)
+        
+        results: List[Any] = [None] * len(specs)
+        
+        with ThreadPoolExecutor(max_workers=min(8, len(specs))) as executor:
+            futures = {
+                executor.submit(run, *call): index
+                for index, call in enumerate(calls)
+            }
             
-            logger.info("Вызов GigaChat для анализа")
-            response = self.giga.invoke([system_message, human_message])
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    logger.error("Ошибка при параллельном вызове агента %s: %s", index, e)
+                    results[index] = _default_error(str(e))
+        
+        return results
+        
+    def call_agent_batched(self, prompt: str, data_list: List[Dict[str, Any]], result_schema: Type[BaseModel], marshal_batch_size: Optional[int] = None, *, has_example: bool = False) -> List[Dict[str, Any]]:
+        """
+        Анализ нескольких наборов данных с объединением их в общие запросы.
+        
+        Инструкции и JSON-схема передаются один раз на пакет, а элементы пакета
+        перечисляются в одном сообщении со стабильными идентификаторами. Если ответ
+        на пакет не удалось разобрать, элементы пакета анализируются по одному.
+        
+        Args:
+            prompt: Промпт для агента.
+            data_list: Список наборов данных для заполнения промпта.
+            result_schema: Схема ожидаемого результата для одного элемента.
+            marshal_batch_size: Число элементов в одном запросе
+                (по умолчанию config.GIGACHAT_MARSHAL_BATCH_SIZE).
+            has_example: Содержит ли промпт собственный пример ответа в формате JSON.
+            
+        Returns:
+            List[Dict[str, Any]]: Результаты в порядке исходного списка.
+        """
+        batch_size = marshal_batch_size or config.GIGACHAT_MARSHAL_BATCH_SIZE
+        results: List[Dict[str, Any]] = []
+        
+        for start in range(0, len(data_list), batch_size):
+            batch = data_list[start:start + batch_size]
             
-            response_text = response.content
+            batch_results = self._call_marshaled(prompt, batch, result_schema) if len(batch) > 1 else None
+            if batch_results is None:
+                batch_results = [
+                    self.call_agent_with_function(prompt, data, result_schema, has_example=has_example)
+                    for data in batch
+                ]
             
-            if is_preprocessor:
-                return response_text
+            results.extend(batch_results)
+        
+        return results
+
+    def _call_marshaled(self, prompt: str, batch: List[Dict[str, Any]], result_schema: Type[BaseModel]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Один запрос к модели для пакета элементов.
+        
+        Args:
+            prompt: Промпт для агента.
+            batch: Наборы данных элементов пакета.
+            result_schema: Схема ожидаемого результата для одного элемента.
             
-            result = self.extract_json_from_text(response_text)
+        Returns:
+            Optional[List[Dict[str, Any]]]: Результаты элементов пакета или None,
+            если ответ на пакет не удалось разобрать. Если запрос не удался из-за
+            временных ошибок, все элементы пакета получают результат с ошибкой,
+            чтобы не умножать нагрузку поэлементными запросами.
+        """
+        try:
+            field_names = list(dict.fromkeys(
+                field_name for _, field_name, _, _ in string.Formatter().parse(prompt) if field_name
+            ))
+            instructions = _compile_prompt(prompt)({name: f"<{name}>" for name in field_names})
+            schema_json = _schema_json_cached(result_schema)
             
-            if "error" not in result:
-                logger.info("Успешно получен результат анализа в формате JSON")
+            system_message = SystemMessage(content=(
+                f"{instructions}\n\nВыполни эту задачу отдельно для каждого из {len(batch)} элементов, "
+                f"перечисленных в сообщении пользователя между <<ITEM id=N>> и <<END>>. "
+                f"Значения полей в угловых скобках выше берутся из соответствующего элемента.\n\n"
+                f"Результат для каждого элемента должен соответствовать JSON-схеме:\n```json\n{schema_json}\n```\n\n"
+                f'Верни один JSON-объект вида {{"results": [{{"id": N, ...поля результата...}}]}} '
+                f"с результатами для всех элементов."
+            ))
+            items_text = _join_batch_items(field_names, batch, _approx_tokens(system_message.content))
+            if items_text is None:
+                logger.warning("Пакет не помещается в контекст модели. Переход к поэлементным вызовам.")
+                return None
+            human_message = HumanMessage(content=items_text)
             
-            return result
-        except Exception as e:
-            logger.error(f"Ошибка при вызове агента: {e}")
+            logger.info("Пакетный вызов GigaChat для %s элементов, ожидаемая схема: %s", len(batch), result_schema.__name__)
+            with _RATE_LIMITER:
+                response = self._invoke_once(lambda: self.giga.invoke([system_message, human_message]))
+            parsed = self.extract_json_from_text(response.content)
             
-            if 'field_type' in data and 'text' in data:
-                return data.get('text', '')
-                
-            return {
-                "metrics": {
-                    "code_requirements_match": 0.0,
-                    "test_requirements_match": 0.0,
-                    "test_code_match": 0.0
-                },
-                "error": str(e)
-            }
+            items = parsed.get("results")
+            if not isinstance(items, list):
+                logger.warning("Ответ на пакетный запрос не содержит списка results. Переход к поэлементным вызовам.")
+                return None
+            
+            by_id = {}
+            for item in items:
+                if isinstance(item, dict) and "id" in item:
+                    by_id[str(item.pop("id"))] = item
+            
+            results = []
+            for index in range(len(batch)):
+                item = by_id.get(str(index))
+                if item is None:
+                    logger.warning("В ответе на пакетный запрос отсутствует элемент %s", index)
+                    item = {}
+                results.append(self._coerce_function_result(item, result_schema, validate=False))
+            
+            return results
+        except Exception as e:
+            if _is_retryable(e):
+                logger.error("Все %s попытки пакетного вызова агента завершились неудачно: %s", _MAX_ATTEMPTS, e)
+                return [
+                    _default_error(f"Не удалось получить ответ от GigaChat после {_MAX_ATTEMPTS} попыток")
+                    for _ in batch
+                ]
+            logger.error("Ошибка при пакетном вызове агента: %s. Переход к поэлементным вызовам.", e)
+            return None
 
-    def call_agent_with_function(self, prompt: str, data: Dict[str, Any], result_schema: Type[BaseModel]) -> Dict[str, Any]:
+    def call_agent_with_function_validated(self, prompt: str, data: Dict[str, Any], result_schema: Type[BaseModel], *, has_example: bool = False, use_cache: bool = True) -> Dict[str, Any]:
         """
-        Вызов агента с заданным промптом, данными и схемой ожидаемого результата.
+        Вызов агента с полной валидацией результата по схеме Pydantic.
         
         Args:
             prompt: Промпт для агента.
             data: Данные для заполнения промпта.
             result_schema: Схема ожидаемого результата.
+            has_example: Содержит ли промпт собственный пример ответа в формате JSON.
+            use_cache: Использовать ли кэш ответов модели.
             
         Returns:
-            Dict[str, Any]: Результат работы агента в формате JSON.
+            Dict[str, Any]: Проверенный результат работы агента в формате JSON.
         """
-        max_attempts = 3
-        base_delay = 2
+        return self.call_agent_with_function(prompt, data, result_schema, validate=True, has_example=has_example, use_cache=use_cache)
         
-        for attempt in range(max_attempts):
-            try:
-                # Получаем JSON-схему из модели Pydantic
-                schema_json = json.dumps(result_schema.model_json_schema(), ensure_ascii=False, indent=2)
-                
-                # Создаем более подробные инструкции для модели
-                schema_info = f"\n\nОтвет должен строго соответствовать следующей JSON-схеме:\n```json\n{schema_json}\n```\n"
-                schema_info += f"\nВажно! Ответ должен быть в формате JSON с правильными типами данных. Если в схеме указано, что поле должно быть object или array, не возвращай строки."
-                
-                # Проверка, содержит ли промпт пример структуры данных
-                has_example = "```json" in prompt
-                if not has_example:
-                    schema_info += f"\n\nПример правильного формата ответа:\n```json\n{json.dumps(self._create_example_from_schema(result_schema), ensure_ascii=False, indent=2)}\n```"
-                
-                filled_prompt = prompt.format(**data) + schema_info
-                
-                system_message = SystemMessage(content=filled_prompt)
-                human_message = HumanMessage(content="Выполни анализ предоставленных данных и верни результат в формате JSON в соответствии с указанной схемой. Убедись, что все поля имеют правильный формат и типы данных.")
-                
-                logger.info(f"Вызов GigaChat в текстовом режиме (попытка {attempt+1}/{max_attempts}), ожидаемая схема: {result_schema.__name__}")
-                response = self.giga.invoke([system_message, human_message])
-                
-                response_text = response.content
-                result = self.extract_json_from_text(response_text)
-                
-                if "error" not in result:
-                    logger.info("Успешно получен результат анализа в формате JSON")
-                    
-                    # Проверяем наличие всех обязательных полей
-                    model_fields = result_schema.model_fields
-                    missing_fields = []
-                    
-                    for field_name, field in model_fields.items():
-                        if field.is_required() and field_name not in result:
-                            missing_fields.append(field_name)
-                            # Добавляем значение по умолчанию
-                            if field.annotation == float:
-                                result[field_name] = 0.0
-                            elif field.annotation == int:
-                                result[field_name] = 0
-                            elif field.annotation == str:
-                                result[field_name] = ""
-                            elif field.annotation == list or "List" in str(field.annotation):
-                                result[field_name] = []
-                            elif field.annotation == dict or "Dict" in str(field.annotation):
-                                result[field_name] = {}
-                    
-                    if missing_fields:
-                        logger.warning(f"В ответе модели отсутствуют обязательные поля: {missing_fields}")
-                    
-                    # Проверяем типы данных полей
-                    for field_name, value in result.items():
-                        if field_name in model_fields:
-                            field = model_fields[field_name]
-                            expected_type = field.annotation
-                            
-                            # Преобразование типов при необходимости
-                            if "List" in str(expected_type) and isinstance(value, str):
-                                logger.warning(f"Поле {field_name} ожидается списком, но получена строка. Попытка преобразования.")
-                                try:
-                                    result[field_name] = [value]
-                                except Exception as e:
-                                    logger.error(f"Ошибка при преобразовании поля {field_name}: {e}")
-                            
-                            if "Dict" in str(expected_type) and isinstance(value, str):
-                                logger.warning(f"Поле {field_name} ожидается словарем, но получена строка. Попытка преобразования.")
-                                try:
-                                    result[field_name] = {"value": value}
-                                except Exception as e:
-                                    logger.error(f"Ошибка при преобразовании поля {field_name}: {e}")
-                    
-                    return result
-                else:
-                    logger.warning(f"Ошибка при извлечении результата: {result.get('error')}")
-                    
-            except Exception as e:
-                logger.error(f"Ошибка при вызове агента (попытка {attempt+1}/{max_attempts}): {e}")
-                
-            if attempt < max_attempts - 1:
-                delay = base_delay * (2 ** attempt)
-                logger.info(f"Повторная попытка через {delay} секунд...")
-                import time
-                time.sleep(delay)
-        
-        logger.error(f"Все {max_attempts} попытки вызова агента завершились неудачно")
-        return {
-            "metrics": {
-                "code_requirements_match": 0.0,
-                "test_requirements_match": 0.0,
-                "test_code_match": 0.0
-            },
-            "error": f"Не удалось получить ответ от GigaChat после {max_attempts} попыток"
-        }
-        
-    def _create_example_from_schema(self, schema_class: Type[BaseModel]) -> Dict[str, Any]:
-        """
-        Создает пример данных на основе схемы Pydantic.
-        
-        Args:
-            schema_class: Класс схемы Pydantic.
-            
-        Returns:
-            Dict[str, Any]: Пример данных.
-        """
-        example = {}
-        
-        for field_name, field in schema_class.model_fields.items():
-            if "float" in str(field.annotation).lower():
-                example[field_name] = 75.5
-            elif "int" in str(field.annotation).lower():
-                example[field_name] = 42
-            elif "str" in str(field.annotation).lower():
-                example[field_name] = f"Пример текста для поля {field_name}"
-            elif "List" in str(field.annotation):
-                if "Dict" in str(field.annotation) or "dict" in str(field.annotation):
-                    example[field_name] = [{"key": "value", "example": "value"}]
-                elif "str" in str(field.annotation).lower():
-                    example[field_name] = ["Пример элемента списка 1", "Пример элемента списка 2"]
-                else:
-                    example[field_name] = ["Пример элемента списка"]
-            elif "Dict" in str(field.annotation) or "dict" in str(field.annotation):
-                example[field_name] = {"key": "value", "example": "value"}
-            else:
-                example[field_name] = "Пример данных"
-                
-        return example
-
     async def chat_completion(self, messages: List[Dict[str, str]]) -> Any:
         """
         Асинхронный метод для работы с диалоговым интерфейсом.
@@ -331,9 +1431,9 @@ class GigaChatService:
             
             # Если последнее сообщение не от пользователя, добавляем запрос на продолжение
             if not user_turn:
-                langchain_messages.append(HumanMessage(content="Продолжи диалог на основе предыдущих сообщений."))
+                langchain_messages.append(_HUMAN_CONTINUE)
             
-            logger.info(f"Отправка {len(langchain_messages)} сообщений в GigaChat")
+            logger.info("Отправка %s сообщений в GigaChat", len(langchain_messages))
             response = self.giga.invoke(langchain_messages)
             
             # Формируем ответ в формате, совместимом с OpenAI API
@@ -354,7 +1454,7 @@ class GigaChatService:
             return result
             
         except Exception as e:
-            logger.error(f"Ошибка при выполнении chat completion: {e}")
+            logger.error("Ошибка при выполнении chat completion: %s", e)
             # Возвращаем минимальный формат ответа с сообщением об ошибке
             return {
                 "choices": [
@@ -381,21 +1481,22 @@ class GigaChatService:
         Returns:
             Dict[str, Any]: Структурированный результат работы модели.
         """
-        max_attempts = 3
-        base_delay = 2
+        try:
+            # Заполняем промпт данными
+            filled_prompt = _fill_prompt(prompt, data)
+            
+            # Создаем structured_llm с использованием схемы Pydantic
+            structured_llm = self._structured_llm(result_schema)
+        except Exception as e:
+            logger.error("Ошибка при подготовке промпта: %s", e)
+            return self._default_structured_result(result_schema)
         
-        for attempt in range(max_attempts):
+        for attempt in range(_MAX_PROMPTS):
             try:
-                # Заполняем промпт данными
-                filled_prompt = prompt.format(**data)
-                
-                # Создаем structured_llm с использованием схемы Pydantic
-                structured_llm = self.giga.with_structured_output(result_schema)
-                
-                logger.info(f"Вызов GigaChat со структурированным выводом (попытка {attempt+1}/{max_attempts})")
+                logger.info("Вызов GigaChat со структурированным выводом (попытка %s/%s)", attempt + 1, _MAX_PROMPTS)
                 
                 # Вызываем модель и получаем структурированный ответ
-                result = structured_llm.invoke(filled_prompt)
+                result = self._invoke_once(lambda: structured_llm.invoke(filled_prompt))
                 
                 # Преобразуем Pydantic-объект в словарь
                 result_dict = result.model_dump()
@@ -404,29 +1505,38 @@ class GigaChatService:
                 return result_dict
                 
             except Exception as e:
-                logger.error(f"Ошибка при вызове модели со структурированным выводом (попытка {attempt+1}/{max_attempts}): {e}")
+                logger.error("Ошибка при вызове модели со структурированным выводом (попытка %s/%s): %s", attempt + 1, _MAX_PROMPTS, e)
                 
-                if attempt < max_attempts - 1:
-                    delay = base_delay * (2 ** attempt)
-                    logger.info(f"Повторная попытка через {delay} секунд...")
-                    import time
-                    time.sleep(delay)
+                if _is_retryable(e):
+                    break
         
-        logger.error(f"Все {max_attempts} попытки вызова модели завершились неудачно")
+        logger.error("Не удалось получить структурированный ответ модели")
+        return self._default_structured_result(result_schema)
+
+    def _default_structured_result(self, result_schema: Type[BaseModel]) -> Dict[str, Any]:
+        """
+        Пустой шаблон результата с дефолтными значениями для call_with_structured_output.
         
-        # Возвращаем пустой шаблон результата с дефолтными значениями
+        Args:
+            result_schema: Схема ожидаемого результата.
+            
+        Returns:
+            Dict[str, Any]: Результат со значениями по умолчанию.
+        """
         default_result = {}
+        field_tags = _schema_field_tags(result_schema)
         for field_name, field in result_schema.model_fields.items():
             if field.is_required():
-                if "float" in str(field.annotation).lower():
+                tag = field_tags[field_name]
+                if tag == "float":
                     default_result[field_name] = 0.0
-                elif "int" in str(field.annotation).lower():
+                elif tag == "int":
                     default_result[field_name] = 0
-                elif "str" in str(field.annotation).lower():
+                elif tag == "str":
                     default_result[field_name] = "Не удалось получить данные"
-                elif "List" in str(field.annotation):
+                elif tag.startswith("list"):
                     default_result[field_name] = []
-                elif "Dict" in str(field.annotation):
+                elif tag == "dict":
                     default_result[field_name] = {}
                 else:
                     default_result[field_name] = None
@@ -444,4 +1554,193 @@ class GigaChatService:
             default_result["improvement_suggestions"] = []
             default_result["overall_assessment"] = "Не удалось выполнить анализ требований. Пожалуйста, попробуйте еще раз."
         
-        return default_result 
\ No newline at end of file
+        return default_result
+
+    async def acall_agent_with_prompt(self, prompt: str, data: Dict[str, Any], *, use_cache: bool = True) -> Any:
+        """
+        Асинхронный вариант call_agent_with_prompt.
+        
+        Args:
+            prompt: Промпт для агента.
+            data: Данные для заполнения промпта.
+            use_cache: Использовать ли кэш ответов модели.
+            
+        Returns:
+            Any: Результат работы агента (текст или словарь с JSON).
+        """
+        filled = _try_fill_prompt(prompt, data)
+        key = self._cache_key(filled) if use_cache else None
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        try:
+            messages, is_preprocessor = self._prompt_messages(prompt, data, filled)
+            
+            logger.info("Асинхронный вызов GigaChat для анализа")
+            if is_preprocessor:
+                result = (await self.giga.ainvoke(messages)).content
+            else:
+                result = self._prompt_result(await self._astream_json(messages))
+        except Exception as e:
+            return self._prompt_error(data, e)
+        
+        self._cache_put(key, result)
+        return result
+
+    async def acall_agent_with_function(self, prompt: str, data: Dict[str, Any], result_schema: Type[BaseModel], validate: bool = False, *, has_example: bool = False, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Асинхронный вариант call_agent_with_function.
+        
+        Args:
+            prompt: Промпт для агента.
+            data: Данные для заполнения промпта.
+            result_schema: Схема ожидаемого результата.
+            validate: Выполнять ли полную валидацию результата через model_validate.
+            has_example: Содержит ли промпт собственный пример ответа в формате JSON.
+            use_cache: Использовать ли кэш ответов модели.
+            
+        Returns:
+            Dict[str, Any]: Результат работы агента в формате JSON.
+        """
+        filled = _try_fill_prompt(prompt, data)
+        key = self._cache_key(filled, result_schema, validate, has_example) if use_cache else None
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        result = await self._acall_agent_with_function(prompt, data, result_schema, validate, has_example, filled)
+        self._cache_put(key, result)
+        return result
+
+    async def _acall_agent_with_function(self, prompt: str, data: Dict[str, Any], result_schema: Type[BaseModel], validate: bool, has_example: bool, filled: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Асинхронный вызов агента со схемой результата без обращения к кэшу ответов.
+        
+        Args:
+            prompt: Промпт для агента.
+            data: Данные для заполнения промпта.
+            result_schema: Схема ожидаемого результата.
+            validate: Выполнять ли полную валидацию результата через model_validate.
+            has_example: Содержит ли промпт собственный пример ответа в формате JSON.
+            filled: Уже заполненный данными шаблон промпта.
+            
+        Returns:
+            Dict[str, Any]: Результат работы агента в формате JSON.
+        """
+        if not self._structured_unsupported:
+            result = await self._acall_with_native_schema(prompt, data, result_schema, filled)
+            if result is not None:
+                return result
+        
+        # Промпт со схемой не зависит от номера попытки, поэтому собираем его один раз
+        try:
+            messages = self._function_messages(prompt, data, result_schema, has_example, filled)
+        except Exception as e:
+            logger.error("Ошибка при подготовке промпта агента: %s", e)
+            return _default_error(str(e))
+        
+        for attempt in range(_MAX_PROMPTS):
+            try:
+                logger.info("Асинхронный вызов GigaChat в текстовом режиме (попытка %s/%s), ожидаемая схема: %s", attempt + 1, _MAX_PROMPTS, result_schema.__name__)
+                result = await self._ainvoke_once(lambda: self._astream_json(messages))
+                
+                if "error" not in result:
+                    logger.info("Успешно получен результат анализа в формате JSON")
+                    return self._coerce_function_result(result, result_schema, validate)
+                else:
+                    logger.warning("Ошибка при извлечении результата: %s", result.get('error'))
+                    
+            except Exception as e:
+                logger.error("Ошибка при вызове агента (попытка %s/%s): %s", attempt + 1, _MAX_PROMPTS, e)
+                
+                if _is_retryable(e):
+                    logger.error("Все %s попытки вызова агента завершились неудачно", _MAX_ATTEMPTS)
+                    return _default_error(f"Не удалось получить ответ от GigaChat после {_MAX_ATTEMPTS} попыток")
+        
+        logger.error("Повторный запрос не исправил ответ модели, дальнейшие попытки прекращены")
+        return _default_error("Ответ GigaChat не удалось привести к ожидаемой схеме")
+
+    async def _acall_with_native_schema(self, prompt: str, data: Dict[str, Any], result_schema: Type[BaseModel], filled: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Асинхронный вариант _call_with_native_schema.
+        
+        Args:
+            prompt: Промпт для агента.
+            data: Данные для заполнения промпта.
+            result_schema: Схема ожидаемого результата.
+            filled: Уже заполненный данными шаблон промпта.
+            
+        Returns:
+            Optional[Dict[str, Any]]: Результат работы агента или None, если нужно
+            использовать текстовый режим.
+        """
+        try:
+            structured_llm = self._structured_llm(result_schema)
+        except Exception as e:
+            return self._native_schema_failed(e, binding=True)
+        
+        try:
+            messages = self._native_schema_messages(prompt, data, filled)
+            
+            logger.info("Асинхронный вызов GigaChat со структурированным выводом, ожидаемая схема: %s", result_schema.__name__)
+            return self._native_schema_result(await self._ainvoke_once(lambda: structured_llm.ainvoke(messages)))
+        except Exception as e:
+            return self._native_schema_failed(e)
+
+    async def acall_with_structured_output(self, prompt: str, data: Dict[str, Any], result_schema: Type[BaseModel]) -> Dict[str, Any]:
+        """
+        Асинхронный вариант call_with_structured_output.
+        
+        Args:
+            prompt: Промпт с инструкциями для модели.
+            data: Данные для заполнения промпта.
+            result_schema: Схема ожидаемого результата.
+            
+        Returns:
+            Dict[str, Any]: Структурированный результат работы модели.
+        """
+        try:
+            filled_prompt = _fill_prompt(prompt, data)
+            structured_llm = self._structured_llm(result_schema)
+        except Exception as e:
+            logger.error("Ошибка при подготовке промпта: %s", e)
+            return self._default_structured_result(result_schema)
+        
+        for attempt in range(_MAX_PROMPTS):
+            try:
+                logger.info("Асинхронный вызов GigaChat со структурированным выводом (попытка %s/%s)", attempt + 1, _MAX_PROMPTS)
+                result = await self._ainvoke_once(lambda: structured_llm.ainvoke(filled_prompt))
+                
+                logger.info("Успешно получен структурированный ответ")
+                return result.model_dump()
+                
+            except Exception as e:
+                logger.error("Ошибка при вызове модели со структурированным выводом (попытка %s/%s): %s", attempt + 1, _MAX_PROMPTS, e)
+                
+                if _is_retryable(e):
+                    break
+        
+        logger.error("Не удалось получить структурированный ответ модели")
+        return self._default_structured_result(result_schema)
+
+    async def batch_agent(self, items: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+        """
+        Одновременный асинхронный вызов агента для нескольких наборов данных.
+        
+        Число одновременных запросов ограничено config.GIGACHAT_RATE_LIMIT.
+        
+        Args:
+            items: Список пар (промпт, данные).
+            
+        Returns:
+            List[Any]: Результаты в порядке исходного списка. Исключения
+            возвращаются на месте соответствующих результатов.
+        """
+        limiter = asyncio.Semaphore(config.GIGACHAT_RATE_LIMIT)
+        
+        async def run(prompt: str, data: Dict[str, Any]) -> Any:
+            async with limiter:
+                return await self.acall_agent_with_prompt(prompt, data)
+        
+        return await asyncio.gather(*(run(prompt, data) for prompt, data in items), return_exceptions=True)
@@ -1,38 +1,471 @@
 """
 Модуль для настройки логирования.
+
+Модули приложения получают логгер один раз при импорте,
+logger = logging.getLogger(__name__), и передают аргументы сообщений
+отдельно от строки формата: logger.info("Текст %s", value). Так форматирование
+выполняется только для записей, которые действительно будут выведены.
 """
+import atexit
+import copy
+import glob
+import io
+import json
 import logging
+import os
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, List, Optional, Tuple
 
 import config
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Соответствие имен уровней логирования их числовым значениям, включая
+# синонимы WARN и FATAL, которые принимает стандартный модуль logging
+_LEVEL_MAP = {
+    name: getattr(logging, name)
+    for name in ("NOTSET", "DEBUG", "INFO", "WARN", "WARNING", "ERROR", "FATAL", "CRITICAL")
+}
+
+
+class FastFormatter(logging.Formatter):
+    """
+    Форматтер с кэшированием отметки времени в пределах одной секунды.
+    
+    Время записывается в UTC: time.gmtime не обращается к настройкам
+    часового пояса, в отличие от time.localtime.
+    
+    Для %-формата разбор строки формата выполняется один раз при создании:
+    запись форматируется одной операцией % без поиска %(asctime) в формате
+    и без промежуточных вызовов стиля.
+    """
+
+    converter = time.gmtime
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        """
+        Инициализация форматтера.
+        
+        Args:
+            *args: Позиционные аргументы logging.Formatter.
+            **kwargs: Именованные аргументы logging.Formatter.
+        """
+        super().__init__(*args, **kwargs)
+        self._time_cache: Tuple[int, str] = (-1, "")
+        self._compiled = type(self._style) is logging.PercentStyle and not self._style._defaults
+        self._uses_time = self._style.usesTime()
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Форматирование записи лога.
+        
+        Args:
+            record: Запись лога.
+            
+        Returns:
+            str: Отформатированная запись.
+        """
+        if not self._compiled:
+            return super().format(record)
+        
+        record.message = record.getMessage()
+        if self._uses_time:
+            record.asctime = self.formatTime(record, self.datefmt)
+        s = self._fmt % record.__dict__
+        
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            if s[-1:] != "\n":
+                s = s + "\n"
+            s = s + record.exc_text
+        if record.stack_info:
+            if s[-1:] != "\n":
+                s = s + "\n"
+            s = s + self.formatStack(record.stack_info)
+        return s
+
+    def formatTime(self, record: logging.LogRecord, datefmt: Optional[str] = None) -> str:
+        """
+        Форматирование времени записи.
+        
+        Args:
+            record: Запись лога.
+            datefmt: Формат даты; если задан, используется стандартная реализация.
+            
+        Returns:
+            str: Отметка времени записи.
+        """
+        if datefmt:
+            return super().formatTime(record, datefmt)
+        
+        second = int(record.created)
+        cache = self._time_cache
+        if cache[0] != second:
+            cache = (second, time.strftime(self.default_time_format, self.converter(record.created)))
+            self._time_cache = cache
+        
+        return self.default_msec_format % (cache[1], record.msecs)
+
+
+class OrjsonFormatter(logging.Formatter):
+    """
+    Форматтер, представляющий запись лога одним JSON-объектом.
+    
+    Сериализация выполняется через orjson, если он установлен, иначе через
+    стандартный json.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Форматирование записи лога.
+        
+        Args:
+            record: Запись лога.
+            
+        Returns:
+            str: Запись в виде строки JSON.
+        """
+        entry = {
+            "t": record.created,
+            "lvl": record.levelname,
+            "name": record.name,
+            "msg": record.getMessage()
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        
+        if orjson is not None:
+            return orjson.dumps(entry, default=str).decode()
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Форматтеры, общие для всех обработчиков
+_FORMATTER = FastFormatter(config.LOG_FORMAT)
+_JSON_FORMATTER = OrjsonFormatter()
+
+# Включены ли уровни DEBUG, INFO и WARNING для корневого логгера. Значения
+# обновляются в setup_logging; читать их нужно через модуль
+# (logging_config.LOG_DEBUG_ENABLED), чтобы получить актуальное значение
+LOG_DEBUG_ENABLED = False
+LOG_INFO_ENABLED = True
+LOG_WARNING_ENABLED = True
+
+# Размер буфера записи файла лога
+_BUFFER_SIZE = 65536
+
+# Фоновый поток, записывающий записи лога из очереди
+_listener: Optional[QueueListener] = None
+
+# Поток периодического сброса буфера файла лога и событие его остановки
+_flush_thread: Optional[threading.Thread] = None
+_flush_stop: Optional[threading.Event] = None
+
+
+class TracebackQueueHandler(QueueHandler):
+    """
+    QueueHandler, сохраняющий текст исключения в отдельном поле записи.
+    
+    Стандартный QueueHandler.prepare полностью форматирует запись и дописывает
+    трассировку к сообщению. Здесь в вызывающем потоке подставляются только
+    аргументы сообщения, а трассировка остается в exc_text, поэтому форматтер
+    в фоновом потоке может вывести ее отдельно.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Подготовка записи к передаче в очередь.
+        
+        Args:
+            record: Запись лога.
+            
+        Returns:
+            logging.LogRecord: Копия записи без несериализуемых ссылок.
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _FORMATTER.formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class FastRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler без системных вызовов stat на каждую запись.
+    
+    Пока текущая позиция в файле с запасом меньше maxBytes, ротация заведомо
+    не нужна, и полная проверка родительского класса не выполняется.
+    
+    Записи накапливаются в буфере размером 64 КБ и сбрасываются на диск
+    периодически, при заполнении буфера и сразу для записей уровня ERROR и выше.
+    Файл открывается в двоичном режиме, а записи кодируются в emit, минуя
+    текстовый слой ввода-вывода.
+    
+    Размер файла проверяется раз в 1024 записи, поэтому перед ротацией файл
+    может незначительно превысить maxBytes.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        """
+        Инициализация обработчика.
+        
+        Args:
+            *args: Позиционные аргументы RotatingFileHandler.
+            **kwargs: Именованные аргументы RotatingFileHandler.
+        """
+        self._check_counter = 0
+        super().__init__(*args, **kwargs)
+
+    def _open(self) -> io.BufferedWriter:
+        """
+        Открытие файла лога в двоичном режиме с буферизацией записи.
+        
+        Returns:
+            io.BufferedWriter: Поток для записи в файл.
+        """
+        return io.BufferedWriter(io.FileIO(self.baseFilename, self.mode), buffer_size=_BUFFER_SIZE)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """
+        Запись в буфер файла без сброса на диск после каждой записи.
+        
+        Args:
+            record: Запись лога.
+        """
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write((self.format(record) + self.terminator).encode(self.encoding or "utf-8", self.errors or "strict"))
+            if record.levelno >= logging.ERROR:
+                self.stream.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        """
+        Проверка необходимости ротации файла перед записью.
+        
+        Args:
+            record: Запись лога.
+            
+        Returns:
+            bool: Нужно ли выполнить ротацию.
+        """
+        self._check_counter += 1
+        if self._check_counter & 0x3FF or self.stream is None:
+            return False
+        
+        if self.maxBytes and self.stream.tell() + len(self.format(record)) + 1 < self.maxBytes:
+            return False
+        
+        return super().shouldRollover(record)
+
+
+class AppendingRotatingHandler(FastRotatingFileHandler):
+    """
+    Обработчик, который при ротации начинает новый файл вместо переименования.
+    
+    Записи пишутся в файлы вида app.<время UTC>.log, открытые только на
+    дозапись. Достигнув maxBytes, обработчик переходит к новому файлу, поэтому
+    читателям не нужно переоткрывать переименованный файл. Файлы сверх
+    backupCount удаляются, начиная с самых старых.
+    """
+
+    def __init__(self, filename: str, *args: Any, **kwargs: Any):
+        """
+        Инициализация обработчика.
+        
+        Args:
+            filename: Базовое имя файла лога, например app.log.
+            *args: Позиционные аргументы RotatingFileHandler.
+            **kwargs: Именованные аргументы RotatingFileHandler.
+        """
+        self._root, self._ext = os.path.splitext(os.path.abspath(filename))
+        super().__init__(self._next_filename(), *args, **kwargs)
+        self._remove_old_files()
+
+    def _next_filename(self) -> str:
+        """
+        Имя следующего файла лога.
+        
+        Returns:
+            str: Путь к файлу с отметкой времени создания.
+        """
+        created = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(created))
+        return "%s.%s-%06d%s" % (self._root, stamp, int(created % 1 * 1000000), self._ext)
+
+    def doRollover(self) -> None:
+        """
+        Переход к новому файлу лога и удаление файлов сверх backupCount.
+        """
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        
+        self.baseFilename = self._next_filename()
+        self._remove_old_files()
+        
+        if not self.delay:
+            self.stream = self._open()
+
+    def _remove_old_files(self) -> None:
+        """
+        Удаление самых старых файлов лога, кроме текущего и backupCount предыдущих.
+        """
+        if self.backupCount <= 0:
+            return
+        
+        pattern = glob.escape(self._root) + ".*" + glob.escape(self._ext)
+        files = sorted(path for path in glob.glob(pattern) if path != self.baseFilename)
+        for path in files[:-self.backupCount]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _silence(prefix: str, level: int) -> None:
+    """
+    Установка уровня логгера библиотеки и всех уже созданных дочерних логгеров.
+    
+    Args:
+        prefix: Имя корневого логгера библиотеки.
+        level: Минимальный уровень записей.
+    """
+    logging.getLogger(prefix).setLevel(level)
+    for name in list(logging.Logger.manager.loggerDict):
+        if name.startswith(prefix + "."):
+            logging.getLogger(name).setLevel(level)
+
+
+def _flush_loop(handler: logging.Handler, stop: threading.Event) -> None:
+    """
+    Периодический сброс буфера файла лога до установки события остановки.
+    
+    Args:
+        handler: Файловый обработчик.
+        stop: Событие остановки потока.
+    """
+    while not stop.wait(config.LOG_FLUSH_INTERVAL):
+        handler.flush()
+
+
+def _shutdown() -> None:
+    """
+    Остановка фоновой записи лога с закрытием ее обработчиков.
+    
+    Накопленные в очереди записи дописываются, а буфер файла сбрасывается
+    на диск при закрытии файлового обработчика.
+    """
+    global _listener, _flush_thread, _flush_stop
+    
+    if _flush_thread is not None:
+        _flush_stop.set()
+        _flush_thread.join()
+        _flush_thread = None
+        _flush_stop = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
 
 def setup_logging():
     """
     Настройка логирования для приложения.
+    
+    Повторный вызов останавливает ранее запущенный фоновый поток записи,
+    предварительно дописав накопленные в очереди записи, и закрывает
+    прежние обработчики.
     """
+    global _listener, _flush_thread, _flush_stop, LOG_DEBUG_ENABLED, LOG_INFO_ENABLED, LOG_WARNING_ENABLED
+    
     log_level_name = config.LOG_LEVEL.upper()
-    log_level = getattr(logging, log_level_name, logging.INFO)
+    log_level = _LEVEL_MAP.get(log_level_name, logging.INFO)
+    formatter = _JSON_FORMATTER if config.LOG_JSON else _FORMATTER
     
-    formatter = logging.Formatter(config.LOG_FORMAT)
+    # Сведения о процессе, потоке и задаче asyncio собираются в каждую запись,
+    # только если формат их выводит
+    logging.logThreads = "%(thread" in config.LOG_FORMAT
+    logging.logProcesses = "%(process)" in config.LOG_FORMAT
+    logging.logMultiprocessing = "%(processName)" in config.LOG_FORMAT
+    logging.logAsyncioTasks = "%(taskName)" in config.LOG_FORMAT
     
     root_logger = logging.getLogger()
     root_logger.setLevel(log_level)
     
-    root_logger.handlers = []
+    LOG_DEBUG_ENABLED = log_level <= logging.DEBUG
+    LOG_INFO_ENABLED = log_level <= logging.INFO
+    LOG_WARNING_ENABLED = log_level <= logging.WARNING
     
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
+    _shutdown()
     
-    file_handler = RotatingFileHandler(
-        "app.log", maxBytes=10485760, backupCount=5, encoding="utf-8"
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+        handler.close()
+    
+    handlers: List[logging.Handler] = []
+    
+    # Без терминала (systemd, docker) вывод в консоль обычно дублирует файл лога
+    if sys.stdout.isatty() or config.FORCE_CONSOLE_LOG:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setLevel(log_level)
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+    
+    handler_class = AppendingRotatingHandler if config.LOG_APPEND_ONLY else FastRotatingFileHandler
+    file_handler = handler_class(
+        "app.log", maxBytes=10485760, backupCount=5, encoding="utf-8", delay=True
     )
+    # При наличии консоли отладочные записи выводятся только в нее и не попадают
+    # на диск; без консоли файл остается единственным местом вывода
+    file_handler.setLevel(max(log_level, logging.INFO) if handlers else log_level)
     file_handler.setFormatter(formatter)
-    root_logger.addHandler(file_handler)
+    handlers.append(file_handler)
+    
+    # Запись в консоль и файл выполняется в фоновом потоке, чтобы не блокировать
+    # обработку запросов дисковым вводом-выводом
+    log_queue = queue.SimpleQueue()
+    root_logger.addHandler(TracebackQueueHandler(log_queue))
+    
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    
+    _flush_stop = threading.Event()
+    _flush_thread = threading.Thread(
+        target=_flush_loop, args=(file_handler, _flush_stop), name="log-flush", daemon=True
+    )
+    _flush_thread.start()
+    
+    atexit.unregister(_shutdown)
+    atexit.register(_shutdown)
+    
+    for prefix in ("uvicorn", "fastapi", "httpx", "httpcore", "openai", "urllib3"):
+        _silence(prefix, logging.WARNING)
     
-    logging.getLogger("uvicorn").setLevel(logging.WARNING)
-    logging.getLogger("fastapi").setLevel(logging.WARNING)
+    # Журнал доступа uvicorn не передается в корневой логгер и его очередь
+    logging.getLogger("uvicorn.access").propagate = False
 
-    logging.info("Логирование настроено с уровнем %s", log_level_name) 
\ No newline at end of file
+    logger.info("Логирование настроено с уровнем %s", log_level_name) 
\ No newline at end of file